@@ -1,16 +1,36 @@
 import os
 import sys
+import errno
+import stat
 import json
+import sqlite3
+import orjson
 import shutil
+import gc
+import hashlib
+import filecmp
+import itertools
 import argparse
-import subprocess
 import acoustid
-from fuzzywuzzy import fuzz
+import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
+from rapidfuzz import fuzz, process, utils
 from mutagen import File
+from mutagen.aac import AAC
+from mutagen.easymp4 import EasyMP4
+from mutagen.flac import FLAC
+from mutagen.mp3 import EasyMP3
+from mutagen.oggflac import OggFLAC
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
+from mutagen.wave import WAVE
 import time
-import gc  # For garbage collection
-from multiprocessing import Pool, cpu_count, Manager, get_context
+from multiprocessing import cpu_count, get_all_start_methods, get_context
 import threading
+import queue
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 from tqdm import tqdm
 
@@ -34,6 +54,27 @@ ACOUSTID_API_KEY = config.get('acoustid_api_key', None)
 FUZZY_THRESHOLD = config.get('fuzzy_threshold', 90)  # Default threshold is 90
 BATCH_SIZE = config.get('batch_size', None)
 
+METADATA_CHUNKSIZE = 64  # Files handed to a pool worker at a time
+CDIST_PARALLEL_MIN_KEYS = 256  # Blocks at least this large are scored on all cores
+CDIST_CHUNK_ROWS = 1024  # Rows of a block's score matrix computed at a time, bounding its memory
+BLOCK_SIGNATURE_LENGTH = 4  # Characters of artist and title at each end that keys must share to be compared
+MAX_BLOCK_SIZE = 2000  # Larger blocks are split again by longer signatures before scoring
+MAX_SIGNATURE_LENGTH = 32  # Signature length at which oversized blocks are scored as they are
+DURATION_TOLERANCE = 1.0  # Seconds within which files with identical tags are treated as the same recording
+SIZE_TOLERANCE = 0.01  # Relative size difference within which files with identical tags are treated as the same recording
+PLACEHOLDER_TAGS = frozenset({'', 'unknown artist', 'unknown title', 'unknown album'})  # Missing-tag values, never trusted
+PREFETCH_MARGIN = 1.1  # Factor on the fingerprinted share of a file read ahead, leaving room for tags and artwork
+CONTENT_SAMPLE_BYTES = 1024 * 1024  # Bytes hashed from each end of a file to spot likely identical copies
+GC_THRESHOLD = (50000, 10, 10)  # Collect young objects less often while building millions of metadata entries
+RESOLVE_THREADS = 32  # Duplicate sets moved or deleted concurrently, as these are filesystem syscall-bound
+
+# AcoustID lookups are network-bound, so they run in threads, throttled to the API rate limit
+ACOUSTID_LOOKUP_URL = 'https://api.acoustid.org/v2/lookup'
+ACOUSTID_LOOKUP_THREADS = 16
+ACOUSTID_RATE_LIMIT = 3  # Requests per second
+ACOUSTID_BATCH_SIZE = 20  # Fingerprints sent per lookup request
+ACOUSTID_MAX_RETRIES = 5
+
 # If no API key, prompt user and save it to the config file
 if not ACOUSTID_API_KEY:
     ACOUSTID_API_KEY = input("Please enter your AcoustID API key: ").strip()
@@ -84,9 +125,42 @@ def setup_logging(log_level):
     logger.addHandler(fh)
     logger.addHandler(ch)
 
-# Dictionary to store cached metadata and fingerprints
-CACHE_FILE = 'file_cache.json'
-file_cache = {}
+# Supported audio file extensions
+AUDIO_EXTENSIONS = frozenset({'.mp3', '.flac', '.ogg', '.wav', '.m4a', '.aac'})
+
+# Lowercased extension for each raw spelling of a supported extension, since the same few repeat across a library;
+# only audio extensions are kept, so odd suffixes in messy trees can't grow it
+extension_cache = {}
+
+def get_extension(file_name):
+    """Returns the lowercased extension of a file name, including the dot."""
+    dot = file_name.rfind('.')
+    if dot < 0:
+        return ''
+    raw_extension = file_name[dot:]
+    extension = extension_cache.get(raw_extension)
+    if extension is None:
+        extension = raw_extension.lower()
+        if extension in AUDIO_EXTENSIONS:
+            extension = extension_cache[raw_extension] = sys.intern(extension)
+    return extension
+
+# Mutagen types to try for each extension, so File() doesn't score every known format per file
+MUTAGEN_TYPES_BY_EXTENSION = {
+    '.mp3': [EasyMP3],
+    '.flac': [FLAC],
+    '.ogg': [OggVorbis, OggOpus, OggFLAC],
+    '.wav': [WAVE],
+    '.m4a': [EasyMP4],
+    '.aac': [AAC],
+}
+
+# SQLite database storing cached metadata and fingerprints
+CACHE_FILE = 'file_cache.db'
+CACHE_VERSION = 5  # Bump when the cached metadata layout changes to discard old entries
+CACHE_SAVE_INTERVAL = 500  # Commit the cache after this many writes
+CACHE_SAVE_SECONDS = 30  # ...or after this many seconds of scanning
+CACHE_MEMORY_ENTRIES = 50000  # Cache entries kept in memory; the rest are read back from the database
 
 # Summary statistics
 summary_stats = {
@@ -94,38 +168,146 @@ summary_stats = {
     'total_duplicates_found': 0,
     'total_files_to_remove': 0,
     'total_storage_to_save': 0,
-    'files_by_format': {},
+    'files_by_format': Counter(),
     'total_acoustid_lookups': 0
 }
 
-# Load cached data if it exists
+# Open the cache database, creating it if it doesn't exist
 def load_cache():
-    try:
-        if os.path.exists(CACHE_FILE):
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        logging.warning(f"Cache file is corrupt or unreadable, recreating it: {e}")
-    return {}
+    conn = sqlite3.connect(CACHE_FILE, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if conn.execute('PRAGMA user_version').fetchone()[0] != CACHE_VERSION:
+        conn.execute('DROP TABLE IF EXISTS files')
+        conn.execute(f'PRAGMA user_version = {CACHE_VERSION}')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS files ('
+        'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, metadata BLOB, acoustid TEXT)'
+    )
+    return conn
+
+class LRUCache(OrderedDict):
+    """Dictionary holding at most `capacity` entries, evicting the least recently used one."""
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.capacity = capacity
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.capacity:
+            self.popitem(last=False)
 
 file_cache = load_cache()
+pending_cache_writes = 0
+
+# Recently used cache entries (size, mtime, metadata, acoustid) kept in memory in front of the database
+recent_entries = LRUCache(CACHE_MEMORY_ENTRIES)
 
-# Save cache to file for persistence
+# Commit pending cache writes for persistence
 def save_cache():
+    global pending_cache_writes
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(file_cache, f)
-    except Exception as e:
+        if file_cache.in_transaction:
+            file_cache.execute('COMMIT')
+    except sqlite3.Error as e:
         logging.error(f"Error saving cache: {e}")
+    pending_cache_writes = 0
+
+def write_cache(sql, params):
+    """Executes a cache write inside the open batch transaction, committing every CACHE_SAVE_INTERVAL writes."""
+    global pending_cache_writes
+    if not file_cache.in_transaction:
+        file_cache.execute('BEGIN')
+    file_cache.execute(sql, params)
+    pending_cache_writes += 1
+    if pending_cache_writes >= CACHE_SAVE_INTERVAL:
+        save_cache()
+
+def get_cached(file_path, size=None, mtime=None):
+    """Returns the cached {'metadata': ..., 'acoustid': ...} entry of a file, or None.
+
+    When the file's current size and mtime are given, the entry is only returned if they still match it.
+    """
+    entry = recent_entries.get(file_path)
+    if entry is None:
+        # Read through to the database on a miss
+        row = file_cache.execute('SELECT size, mtime, metadata, acoustid FROM files WHERE path = ?', (file_path,)).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], row[1], orjson.loads(row[2]), row[3])
+        recent_entries[file_path] = entry
+
+    cached_size, cached_mtime, metadata, acoustid_rid = entry
+    if size is not None and (cached_size != size or cached_mtime != mtime):
+        return None
+    return {'metadata': metadata, 'acoustid': acoustid_rid}
+
+def cache_metadata(file_path, metadata):
+    """Stores freshly read metadata, discarding any AcoustID cached for an older version of the file."""
+    write_cache(
+        'INSERT OR REPLACE INTO files (path, size, mtime, metadata, acoustid) VALUES (?, ?, ?, ?, NULL)',
+        (file_path, metadata['size'], metadata['mtime'], orjson.dumps(metadata)),
+    )
+    recent_entries[file_path] = (metadata['size'], metadata['mtime'], metadata, None)
+
+def cache_acoustid(file_path, rid):
+    """Stores the AcoustID recording ID of a file."""
+    write_cache('UPDATE files SET acoustid = ? WHERE path = ?', (rid, file_path))
+    entry = recent_entries.get(file_path)
+    if entry:
+        recent_entries[file_path] = entry[:3] + (rid,)
+
+def is_missing(file_path):
+    """Returns True only if the path definitely no longer exists, not when it merely can't be checked."""
+    try:
+        os.lstat(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return True
+    except OSError:
+        return False
+    return False
+
+def prune_cache(directory, seen_paths, unreadable_dirs=()):
+    """Removes cache entries for files under directory that were not found by the latest scan and no longer exist.
+
+    Entries below directories the scan couldn't read are kept, so a temporary permission or mount problem
+    doesn't throw away their metadata and fingerprints.
+    """
+    # Range query on the primary key covering every path that starts with the directory prefix
+    prefix = os.path.join(directory, '')
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    rows = file_cache.execute('SELECT path FROM files WHERE path >= ? AND path < ?', (prefix, upper_bound)).fetchall()
+    unreadable_prefixes = tuple(os.path.join(unreadable_dir, '') for unreadable_dir in unreadable_dirs)
+    stale = [
+        row for row in rows
+        if row[0] not in seen_paths and not row[0].startswith(unreadable_prefixes) and is_missing(row[0])
+    ]
+    if not stale:
+        return
+
+    if not file_cache.in_transaction:
+        file_cache.execute('BEGIN')
+    file_cache.executemany('DELETE FROM files WHERE path = ?', stale)
+    for (file_path,) in stale:
+        recent_entries.pop(file_path, None)
+    logging.debug(f"Removed {len(stale)} stale cache entries")
 
 def validate_cached_data(file_path):
     """Re-validates cached data only if the file has changed."""
-    file_mtime = os.path.getmtime(file_path)
-    cached_mtime = file_cache.get(file_path, {}).get('metadata', {}).get('mtime')
-    if cached_mtime == file_mtime:
-        # No changes, use cached data
-        metadata = file_cache[file_path]['metadata']
-        acoustid_rid = file_cache[file_path].get('acoustid')
+    st = os.stat(file_path)
+    cached = get_cached(file_path, st.st_size, st.st_mtime)
+    if cached:
+        # Size and mtime are unchanged, use cached data without re-reading tags or fingerprinting
+        metadata = cached['metadata']
+        acoustid_rid = cached['acoustid']
     else:
         # File has changed, re-validate
         metadata = get_file_metadata(file_path, revalidate=True)
@@ -134,33 +316,54 @@ def validate_cached_data(file_path):
 
 def get_file_metadata(file_path, revalidate=False):
     """Fetches or re-validates metadata of the music file using Mutagen and caches it for performance."""
-    if not revalidate and file_path in file_cache and 'metadata' in file_cache[file_path]:
-        return file_cache[file_path]['metadata']
-
+    if not revalidate:
+        cached = get_cached(file_path)
+        if cached:
+            return cached['metadata']
+
+    file_metadata = read_file_metadata(file_path)
+    if file_metadata:
+        cache_metadata(file_path, file_metadata)
+    return file_metadata
+
+def read_file_metadata(file_path, size=None, mtime=None, file_extension=None):
+    """Reads metadata of the music file using Mutagen, without touching the cache.
+
+    Size, mtime and extension already known from the directory scan are reused instead of being derived again.
+    """
+    if file_extension is None:
+        file_extension = get_extension(os.path.basename(file_path))
     try:
-        audio = File(file_path, easy=True)
+        file_types = MUTAGEN_TYPES_BY_EXTENSION.get(file_extension)
+        audio = File(file_path, options=file_types, easy=True)
+        if audio is None and file_types:
+            # The extension doesn't match the content, fall back to scoring every known format
+            audio = File(file_path, easy=True)
         if audio is None:
             logging.warning(f"Unsupported file format or corrupted file: {file_path}")
             return None
 
-        file_metadata = {}
-        file_metadata['size'] = os.path.getsize(file_path)
-        file_metadata['mtime'] = os.path.getmtime(file_path)
+        if size is None:
+            st = os.stat(file_path)
+            size, mtime = st.st_size, st.st_mtime
 
-        # Normalize case by converting artist, title, and album to lowercase for case-insensitive comparison
-        file_metadata['artist'] = audio.get('artist', ['Unknown Artist'])[0].lower()
-        file_metadata['title'] = audio.get('title', ['Unknown Title'])[0].lower()
-        file_metadata['album'] = audio.get('album', ['Unknown Album'])[0].lower()
+        file_metadata = {}
+        file_metadata['size'] = size
+        file_metadata['mtime'] = mtime
+
+        # Normalize artist, title, and album once here (casefold and strip) so comparisons never redo it
+        file_metadata['artist'] = audio.get('artist', ['Unknown Artist'])[0].strip().casefold()
+        file_metadata['title'] = audio.get('title', ['Unknown Title'])[0].strip().casefold()
+        file_metadata['album'] = audio.get('album', ['Unknown Album'])[0].strip().casefold()
+        # Fuzzy matching compares the rapidfuzz-normalized forms (no punctuation, collapsed whitespace),
+        # computed once here and cached instead of on every comparison; punctuation-only values are kept as is
+        for field in ('artist', 'title', 'album'):
+            file_metadata[f'{field}_norm'] = utils.default_process(file_metadata[field]) or file_metadata[field]
         file_metadata['tracknumber'] = audio.get('tracknumber', [0])[0]
-
-        file_extension = os.path.splitext(file_path)[1].lower()
+        file_metadata['duration'] = getattr(audio.info, 'length', None)
         file_metadata['format'] = file_extension.strip('.')
-        summary_stats['files_by_format'].setdefault(file_metadata['format'], 0)
-        summary_stats['files_by_format'][file_metadata['format']] += 1
-
-        # Update or add the cached metadata
-        file_cache.setdefault(file_path, {})
-        file_cache[file_path]['metadata'] = file_metadata
+        # Cheap fingerprint of the raw bytes, so likely identical copies are found without reading files again
+        file_metadata['content_hash'] = sampled_content_hash(file_path, size)
         return file_metadata
     except FileNotFoundError as e:
         logging.error(f"File not found: {file_path} - {e}")
@@ -171,190 +374,380 @@ def get_file_metadata(file_path, revalidate=False):
 
 def get_acoustid(file_path, revalidate=False):
     """Fetches or re-validates the AcoustID fingerprint and caches it for performance."""
-    if not revalidate and file_path in file_cache and 'acoustid' in file_cache[file_path]:
-        return file_cache[file_path]['acoustid']
+    if not revalidate:
+        cached = get_cached(file_path)
+        if cached and cached['acoustid']:
+            return cached['acoustid']
+
+    fingerprint_data = fingerprint_file(file_path)
+    if not fingerprint_data:
+        return None
+
+    rid = lookup_acoustid(file_path, *fingerprint_data)
+    if rid:
+        # Cache the AcoustID result
+        cache_acoustid(file_path, rid)
+    return rid
 
+def fingerprint_file(file_path):
+    """Fingerprints the file and returns its (duration, fingerprint)."""
     try:
-        # Use fpcalc via subprocess
-        result = subprocess.run(['fpcalc', '-json', file_path], capture_output=True, text=True)
-        if result.returncode != 0:
-            logging.warning(f"fpcalc failed for {file_path}: {result.stderr.strip()}")
-            return None
+        # Always use fpcalc: pyacoustid's library path decodes through audioread, which usually also runs an
+        # ffmpeg subprocess per file and then pipes the PCM through Python
+        return acoustid.fingerprint_file(file_path, force_fpcalc=True)
+    except acoustid.NoBackendError as e:
+        logging.error(f"Fingerprinting failed for {file_path}: fpcalc is not available ({e})")
+        return None
+    except acoustid.FingerprintGenerationError as e:
+        logging.warning(f"Fingerprinting failed for {file_path}: {e}")
+        return None
+    except FileNotFoundError as e:
+        logging.error(f"File not found: {file_path} - {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Fingerprinting failed for {file_path}: {e}")
+        return None
 
-        fingerprint_data = json.loads(result.stdout)
-        duration = fingerprint_data['duration']
-        fingerprint = fingerprint_data['fingerprint']
+def lookup_acoustid(file_path, duration, fingerprint):
+    """Looks up a single fingerprint on AcoustID and returns the best matching recording ID."""
+    return lookup_acoustid_batch([(file_path, duration, fingerprint)])[0][1]
 
-        response = acoustid_lookup(ACOUSTID_API_KEY, fingerprint, duration)
+def lookup_acoustid_batch(batch):
+    """Looks up a batch of (file_path, duration, fingerprint) in one AcoustID request and returns (file_path, rid) pairs."""
+    rids = [None] * len(batch)
+    try:
+        response = acoustid_lookup(ACOUSTID_API_KEY, [(duration, fingerprint) for _, duration, fingerprint in batch])
         if response['status'] != 'ok':
             error_message = response.get('error', {}).get('message', 'Unknown error')
-            logging.warning(f"AcoustID lookup failed for {file_path}: {error_message}")
-            return None
-
-        results = response.get('results', [])
-        if not results:
-            return None
-
-        # Get the best match (highest score)
-        best_result = max(results, key=lambda x: x.get('score', 0))
+            logging.warning(f"AcoustID lookup failed for {len(batch)} files starting with {batch[0][0]}: {error_message}")
+        elif 'fingerprints' in response:
+            # Batch responses carry one result list per submitted fingerprint index
+            for entry in response['fingerprints']:
+                rids[int(entry['index'])] = best_recording_id(entry.get('results', []))
+        else:
+            rids[0] = best_recording_id(response.get('results', []))
+    except Exception as e:
+        logging.error(f"AcoustID lookup failed for {len(batch)} files starting with {batch[0][0]}: {e}")
+    return [(file_path, rid) for (file_path, _, _), rid in zip(batch, rids)]
 
-        # Extract recording information
-        recordings = best_result.get('recordings', [])
-        if not recordings:
-            return None
+def best_recording_id(results):
+    """Returns the recording ID of the highest scoring AcoustID result."""
+    if not results:
+        return None
 
-        recording = recordings[0]  # Use the first recording
-        rid = recording.get('id')
+    # Get the best match (highest score)
+    best_result = max(results, key=lambda x: x.get('score', 0))
 
-        # Cache the AcoustID result
-        file_cache.setdefault(file_path, {})
-        file_cache[file_path]['acoustid'] = rid
-        return rid
-    except FileNotFoundError as e:
-        logging.error(f"File not found: {file_path} - {e}")
-        return None
-    except Exception as e:
-        logging.error(f"AcoustID lookup failed for {file_path}: {e}")
+    # Extract recording information
+    recordings = best_result.get('recordings', [])
+    if not recordings:
         return None
 
-def acoustid_lookup(api_key, fingerprint, duration):
-    """Performs AcoustID lookup synchronously."""
-    return acoustid.lookup(api_key, fingerprint, duration, meta='recordings artists')
+    recording = recordings[0]  # Use the first recording
+    return recording.get('id')
+
+class RateLimiter:
+    """Spaces out calls across threads so that at most `rate` calls start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+# AcoustID allows 3 requests per second per API key
+acoustid_rate_limiter = RateLimiter(ACOUSTID_RATE_LIMIT)
+
+def create_http_session():
+    """Creates a keep-alive HTTP session with a connection pool sized for the lookup threads."""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=ACOUSTID_LOOKUP_THREADS))
+    return session
+
+# Shared by all lookups so TLS connections are reused instead of set up per request
+http_session = create_http_session()
+
+def acoustid_lookup(api_key, fingerprints):
+    """Performs one AcoustID lookup for a list of (duration, fingerprint), respecting the API rate limit."""
+    params = {'client': api_key, 'meta': 'recordings', 'format': 'json'}
+    for i, (duration, fingerprint) in enumerate(fingerprints):
+        params[f'duration.{i}'] = int(duration)
+        params[f'fingerprint.{i}'] = fingerprint
+
+    for attempt in range(ACOUSTID_MAX_RETRIES):
+        acoustid_rate_limiter.wait()
+        response = http_session.post(ACOUSTID_LOOKUP_URL, data=params, timeout=30)
+        if response.status_code != 429:
+            return orjson.loads(response.content)
+
+        # Rate limited, so back off before retrying
+        retry_after = response.headers.get('Retry-After')
+        delay = float(retry_after) if retry_after else 2 ** attempt
+        logging.debug(f"AcoustID rate limit hit, retrying in {delay:.1f} seconds")
+        time.sleep(delay)
+
+    response.raise_for_status()
+
+def fuzzy_key(key):
+    """Joins an (artist, title, album) key into the single string that is fuzzy-compared."""
+    return ' | '.join(key)
+
+def block_signatures(artist, title, length=BLOCK_SIGNATURE_LENGTH):
+    """Returns the cheap blocking signatures of a key; only keys sharing a signature are fuzzy-compared.
+
+    Keys are indexed under both a prefix and a suffix signature, so a typo at one end of the artist
+    or title still leaves the keys sharing a block.
+    """
+    return ('prefix', artist[:length], title[:length]), ('suffix', artist[-length:], title[-length:])
+
+def iter_blocks(keys):
+    """Yields the lists of key indices sharing a blocking signature, splitting oversized blocks.
+
+    Common endings such as "various artists" with "(original mix)" put thousands of keys in one block,
+    so blocks above MAX_BLOCK_SIZE are split again by signatures of the same kind twice as long.
+    """
+    blocks = defaultdict(list)
+    for i, (artist, title, _) in enumerate(keys):
+        for signature in block_signatures(artist, title):
+            blocks[signature].append(i)
+
+    pending = [(signature[0], BLOCK_SIGNATURE_LENGTH, block) for signature, block in blocks.items()]
+    while pending:
+        kind, length, block = pending.pop()
+        if len(block) <= MAX_BLOCK_SIZE or length >= MAX_SIGNATURE_LENGTH:
+            yield block
+            continue
+
+        length *= 2
+        sub_blocks = defaultdict(list)
+        for i in block:
+            artist, title, _ = keys[i]
+            prefix_signature, suffix_signature = block_signatures(artist, title, length)
+            sub_blocks[prefix_signature if kind == 'prefix' else suffix_signature].append(i)
+        pending.extend((kind, length, sub_block) for sub_block in sub_blocks.values())
+
+def find_root(parent, i):
+    """Returns the root of i in a union-find parent list, halving the path as it goes."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def group_similar_keys(keys):
+    """Groups (artist, title, album) keys whose fuzzy match reaches FUZZY_THRESHOLD."""
+    keys = list(keys)
+
+    # One union-find over all keys, so matches found in any block join the same set;
+    # only keys sharing a block are compared
+    parent = list(range(len(keys)))
+    for block in iter_blocks(keys):
+        if len(block) < 2:
+            continue
+
+        # All-pairs scores for the block in vectorized calls, multi-threaded for large blocks;
+        # WRatio on the joined key also tolerates reordered words ("beatles, the" vs "the beatles"), and
+        # score_cutoff lets rapidfuzz skip pairs that can't reach the threshold (e.g. very different lengths).
+        # Rows are scored CDIST_CHUNK_ROWS at a time so a large block never needs a full N x N matrix
+        block_keys = [fuzzy_key(keys[i]) for i in block]
+        workers = -1 if len(block) >= CDIST_PARALLEL_MIN_KEYS else 1
+        for start in range(0, len(block), CDIST_CHUNK_ROWS):
+            scores = process.cdist(block_keys[start:start + CDIST_CHUNK_ROWS], block_keys, scorer=fuzz.WRatio, processor=None, score_cutoff=FUZZY_THRESHOLD, dtype=np.uint8, workers=workers)
+            for i, j in zip(*np.nonzero(scores >= FUZZY_THRESHOLD)):
+                i += start
+                if i < j:
+                    parent[find_root(parent, block[i])] = find_root(parent, block[j])
+
+    groups = defaultdict(list)
+    for i, key in enumerate(keys):
+        groups[find_root(parent, i)].append(key)
+    return list(groups.values())
+
+def iter_audio_files(directory, unreadable_dirs=None):
+    """Recursively yields (file_path, size, mtime, extension) for audio files, using a single stat per file from os.scandir.
+
+    Directories that can't be read are logged and appended to unreadable_dirs when it is given.
+    """
+    try:
+        entries = os.scandir(directory)
+    except OSError as e:
+        logging.warning(f"Cannot read directory {directory}: {e}")
+        if unreadable_dirs is not None:
+            unreadable_dirs.append(directory)
+        return
 
-def fuzzy_match(metadata1, metadata2):
-    """Performs fuzzy matching between two metadata sets (title, artist, album) and returns the similarity percentage."""
-    title_match = fuzz.ratio(metadata1['title'], metadata2['title'])
-    artist_match = fuzz.ratio(metadata1['artist'], metadata2['artist'])
-    album_match = fuzz.ratio(metadata1['album'], metadata2['album'])
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_audio_files(entry.path, unreadable_dirs)
+                continue
+            # Most non-audio entries are rejected by a memoized extension and a single set lookup
+            file_extension = get_extension(entry.name)
+            if file_extension not in AUDIO_EXTENSIONS:
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                logging.warning(f"Skipping broken symbolic link: {entry.path}")
+                continue
+            except OSError as e:
+                # Symlink loops, unreadable targets and the like are skipped rather than aborting the scan
+                logging.warning(f"Skipping unreadable file {entry.path}: {e}")
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                logging.warning(f"File does not exist or is not a regular file: {entry.path}")
+                continue
+            yield entry.path, st.st_size, st.st_mtime, file_extension
 
-    # Average percentage match across title, artist, and album
-    avg_match = (title_match + artist_match + album_match) / 3
+def create_worker_pool():
+    """Creates the process pool shared by the metadata and fingerprinting phases of a run."""
+    # forkserver imports this module once and forks every worker from it, where spawn re-imports it per worker
+    start_method = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+    ctx = get_context(start_method)
+    return ctx.Pool(processes=cpu_count(), initializer=reopen_cache)
 
-    return avg_match
+def reopen_cache():
+    """Gives a pool worker its own cache connection, as SQLite connections must not be shared across a fork."""
+    global file_cache
+    file_cache = load_cache()
 
-def find_duplicates(directory, verbose=False, use_multiprocessing=True):
+def find_duplicates(directory, verbose=False, pool=None):
     """Recursively scans directory for music files and identifies duplicates based on metadata matching."""
-    files_by_metadata = {}
+    files_by_metadata = defaultdict(list)
     duplicates = []
     start_time = time.time()
-    file_paths = []
-
-    # Collect all file paths
-    for root, _, files in os.walk(directory):
-        for file in files:
-            # Convert to absolute path and ensure it's properly normalized
-            file_path = os.path.abspath(os.path.join(root, file))
-            if not file.lower().endswith(('.mp3', '.flac', '.ogg', '.wav', '.m4a', '.aac')):
-                continue
-            if os.path.islink(file_path) and not os.path.exists(file_path):
-                logging.warning(f"Skipping broken symbolic link: {file_path}")
-                continue
-            if not os.path.isfile(file_path):
-                logging.warning(f"File does not exist or is not a regular file: {file_path}")
-                continue
-            file_paths.append(file_path)
-
-    if use_multiprocessing:
-        num_processes = cpu_count()
-        ctx = get_context('spawn')  # Use 'spawn' to start fresh processes
-        with ctx.Pool(processes=num_processes) as pool:
-            for i in range(0, len(file_paths), BATCH_SIZE):
-                batch = file_paths[i:i+BATCH_SIZE]
-                results = pool.map(process_file_metadata, batch)
-                for result in results:
-                    if result:
-                        key, file_path = result
-                        files_by_metadata.setdefault(key, []).append(file_path)
-                summary_stats['total_files_processed'] += len(batch)
-
-                # Verbose output
-                if verbose:
-                    elapsed_time = time.time() - start_time
-                    files_per_sec = summary_stats['total_files_processed'] / elapsed_time
-                    logging.info(f"Processed {summary_stats['total_files_processed']} files. Speed: {files_per_sec:.2f} files/sec")
-
-                save_cache()  # Save cache after each batch
-                gc.collect()  # Force garbage collection
+
+    # Collect all audio files along with the size, mtime and extension from the directory scan
+    directory = os.path.abspath(directory)
+    unreadable_dirs = []
+    audio_files = list(iter_audio_files(directory, unreadable_dirs))
+
+    # Drop cache entries of files that were deleted or renamed since the last run
+    prune_cache(directory, {file_info[0] for file_info in audio_files}, unreadable_dirs)
+
+    if pool is not None:
+        # Stream results back as workers finish instead of waiting on each batch
+        results = pool.imap_unordered(process_file_metadata, audio_files, chunksize=METADATA_CHUNKSIZE)
+        collect_metadata_results(results, files_by_metadata, verbose, start_time)
     else:
         # Single-threaded processing for debugging
-        for i in range(0, len(file_paths), BATCH_SIZE):
-            batch = file_paths[i:i+BATCH_SIZE]
-            results = map(process_file_metadata, batch)
-            for result in results:
-                if result:
-                    key, file_path = result
-                    files_by_metadata.setdefault(key, []).append(file_path)
-            summary_stats['total_files_processed'] += len(batch)
-
-            # Verbose output
-            if verbose:
-                elapsed_time = time.time() - start_time
-                files_per_sec = summary_stats['total_files_processed'] / elapsed_time
-                logging.info(f"Processed {summary_stats['total_files_processed']} files. Speed: {files_per_sec:.2f} files/sec")
-
-            save_cache()  # Save cache after each batch
-            gc.collect()  # Force garbage collection
-
-    # Identify potential duplicates based on metadata
-    potential_duplicates = []
-    for file_list in files_by_metadata.values():
-        if len(file_list) > 1:
-            potential_duplicates.append(file_list)
+        collect_metadata_results(map(process_file_metadata, audio_files), files_by_metadata, verbose, start_time)
+
+    # Commit the scanned metadata so pool workers see fresh entries during the AcoustID phase
+    save_cache()
+
+    # Identify potential duplicates by merging metadata groups whose tags fuzzy-match, collecting
+    # the files of every group with more than one file straight into the AcoustID work list
+    candidate_files = []
+    for key_group in group_similar_keys(files_by_metadata):
+        if len(key_group) > 1 or len(files_by_metadata[key_group[0]]) > 1:
+            candidate_files.extend(file_path for key in key_group for file_path in files_by_metadata[key])
 
     # Perform AcoustID fingerprinting on potential duplicates
-    if potential_duplicates:
-        process_acoustid(potential_duplicates, duplicates, verbose, start_time, use_multiprocessing)
+    if candidate_files:
+        process_acoustid(candidate_files, duplicates, verbose, start_time, pool)
 
     # Update summary statistics
     summary_stats['total_duplicates_found'] = len(duplicates)
 
     return duplicates
 
-def process_file_metadata(file_path):
-    """Processes a file to extract metadata for duplicate detection."""
-    metadata = get_file_metadata(file_path)
+def collect_metadata_results(results, files_by_metadata, verbose, start_time):
+    """Groups metadata results by key as they arrive, caching new metadata and reporting progress."""
+    last_save = time.monotonic()
+    format_counts = summary_stats['files_by_format']
+    for result in results:
+        if result:
+            key, file_path, file_format, new_metadata = result
+            format_counts[file_format] += 1
+            if new_metadata:
+                cache_metadata(file_path, new_metadata)
+
+            if key not in files_by_metadata:
+                # Intern the tag strings of new keys; artists and albums repeat across many keys
+                key = tuple(map(sys.intern, key))
+            files_by_metadata[key].append(file_path)
+        summary_stats['total_files_processed'] += 1
+
+        # Verbose output every BATCH_SIZE files
+        if verbose and summary_stats['total_files_processed'] % BATCH_SIZE == 0:
+            elapsed_time = time.time() - start_time
+            files_per_sec = summary_stats['total_files_processed'] / elapsed_time
+            logging.info(f"Processed {summary_stats['total_files_processed']} files. Speed: {files_per_sec:.2f} files/sec")
+
+        # Commit periodically so an interrupted scan keeps its progress
+        if time.monotonic() - last_save >= CACHE_SAVE_SECONDS:
+            save_cache()
+            last_save = time.monotonic()
+
+def process_file_metadata(file_info):
+    """Processes a (file_path, size, mtime, extension) entry to extract metadata for duplicate detection.
+
+    Workers only read the cache and never touch summary_stats, so the file format and any freshly
+    read metadata are returned for the parent process to count and store.
+    """
+    file_path, size, mtime, file_extension = file_info
+    cached = get_cached(file_path, size, mtime)
+    if cached:
+        metadata, new_metadata = cached['metadata'], None
+    else:
+        metadata = new_metadata = read_file_metadata(file_path, size, mtime, file_extension)
     if not metadata:
         return None
 
     # Use metadata key
-    metadata_key = (metadata['artist'], metadata['title'], metadata['album'])
-    return metadata_key, file_path
+    metadata_key = (metadata['artist_norm'], metadata['title_norm'], metadata['album_norm'])
+    return metadata_key, file_path, metadata['format'], new_metadata
 
-def process_acoustid(potential_duplicates, duplicates, verbose, start_time, use_multiprocessing):
+def process_acoustid(file_list, duplicates, verbose, start_time, pool=None):
     """Processes potential duplicates using AcoustID fingerprinting."""
-    acoustid_results = {}
-    file_list = [file for sublist in potential_duplicates for file in sublist]
-
-    if verbose:
-        progress_bar = tqdm(total=len(file_list), desc="AcoustID Lookups", unit="file")
-
-    if use_multiprocessing:
-        num_processes = cpu_count()
-        ctx = get_context('spawn')  # Use 'spawn' to start fresh processes
-        with ctx.Pool(processes=num_processes) as pool:
-            # Use imap_unordered to process results as they become available
-            for result in pool.imap_unordered(process_file_acoustid, file_list):
-                if result:
-                    rid, file_path = result
-                    acoustid_results.setdefault(rid, []).append(file_path)
-                summary_stats['total_acoustid_lookups'] += 1
-
-                # Update progress bar
-                if verbose:
-                    progress_bar.update(1)
-    else:
-        # Single-threaded processing for debugging
-        for result in map(process_file_acoustid, file_list):
-            if result:
-                rid, file_path = result
-                acoustid_results.setdefault(rid, []).append(file_path)
-            summary_stats['total_acoustid_lookups'] += 1
-
-            # Update progress bar
-            if verbose:
-                progress_bar.update(1)
-
-    if verbose:
+    acoustid_results = defaultdict(list)
+    progress_bar = tqdm(total=len(file_list), desc="AcoustID Lookups", unit="file") if verbose else None
+
+    # Byte-identical copies are duplicates outright, so only one file of each needs identifying
+    file_list, identical_copies = split_identical_copies(file_list)
+
+    # Only one file per set of identical tags and duration needs fingerprinting
+    to_fingerprint, tag_twins = split_tag_twins(file_list)
+    run_acoustid_pipeline(to_fingerprint, acoustid_results, progress_bar, pool)
+
+    rid_by_file = {file_path: rid for rid, file_paths in acoustid_results.items() for file_path in file_paths}
+    unidentified = []
+    for representative, twins in tag_twins.items():
+        rid = rid_by_file.get(representative)
+        if rid:
+            for file_path in twins:
+                record_acoustid_result(file_path, rid, acoustid_results, progress_bar)
+        else:
+            unidentified.extend(twins)
+
+    # The representative couldn't be identified, so fingerprint its twins after all
+    if unidentified:
+        run_acoustid_pipeline(unidentified, acoustid_results, progress_bar, pool)
+
+    # Copies join their original's AcoustID set; without an AcoustID nothing else vouches for them,
+    # so they only form a set of their own once a full comparison proves them identical
+    rid_by_file = {file_path: rid for rid, file_paths in acoustid_results.items() for file_path in file_paths}
+    unidentified_copies = []
+    for representative, copies in identical_copies.items():
+        rid = rid_by_file.get(representative)
+        if rid:
+            for file_path in copies:
+                record_acoustid_result(file_path, rid, acoustid_results, progress_bar)
+        else:
+            unidentified_copies.append((representative, copies))
+            if progress_bar:
+                progress_bar.update(len(copies))
+    if unidentified_copies:
+        confirm_identical_copies(unidentified_copies, duplicates, pool)
+
+    if progress_bar:
         progress_bar.close()
 
     # Identify duplicates based on AcoustID
@@ -362,25 +755,243 @@ def process_acoustid(potential_duplicates, duplicates, verbose, start_time, use_
         if len(file_list) > 1:
             duplicates.append(file_list)
 
-def process_file_acoustid(file_path):
-    """Processes a file to obtain its AcoustID."""
-    rid = get_acoustid(file_path)
+def split_identical_copies(file_list):
+    """Splits files into those to identify and {representative: [likely copies]}.
+
+    Likely copies share their size and the sampled content hash computed by the metadata workers, so
+    no file is read here; copies are only compared in full when no AcoustID vouches for them.
+    """
+    to_identify = []
+    identical_copies = defaultdict(list)
+    representatives = {}
+    for file_path in file_list:
+        cached = get_cached(file_path)
+        content_hash = cached['metadata'].get('content_hash') if cached else None
+        if content_hash is None:
+            to_identify.append(file_path)
+            continue
+
+        representative = representatives.setdefault((cached['metadata']['size'], content_hash), file_path)
+        if representative == file_path:
+            to_identify.append(file_path)
+        else:
+            identical_copies[representative].append(file_path)
+    return to_identify, identical_copies
+
+def confirm_identical_copies(candidates, duplicates, pool=None):
+    """Compares each (representative, copies) candidate in full and adds confirmed byte-identical copies as duplicates.
+
+    Comparisons read both files end to end, so they run in the process pool when there is one.
+    """
+    pairs = [(representative, file_path) for representative, copies in candidates for file_path in copies]
+    results = pool.starmap(files_identical, pairs) if pool is not None else itertools.starmap(files_identical, pairs)
+
+    confirmed = defaultdict(list)
+    for (representative, file_path), identical in zip(pairs, results):
+        if identical:
+            confirmed[representative].append(file_path)
+    for representative, copies in confirmed.items():
+        duplicates.append([representative] + copies)
+
+def files_identical(file_path1, file_path2):
+    """Returns True if both files have exactly the same contents, False if they differ or can't be read."""
+    try:
+        return filecmp.cmp(file_path1, file_path2, shallow=False)
+    except OSError as e:
+        logging.warning(f"Could not compare {file_path1} with {file_path2}: {e}")
+        return False
+
+def sampled_content_hash(file_path, size):
+    """Returns a hex BLAKE2 digest of the file's size and its first and last CONTENT_SAMPLE_BYTES, or None if unreadable."""
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    try:
+        with open(file_path, 'rb') as f:
+            digest.update(f.read(CONTENT_SAMPLE_BYTES))
+            if size > CONTENT_SAMPLE_BYTES:
+                f.seek(max(CONTENT_SAMPLE_BYTES, size - CONTENT_SAMPLE_BYTES))
+                digest.update(f.read(CONTENT_SAMPLE_BYTES))
+    except OSError as e:
+        logging.warning(f"Could not read {file_path} for content hashing: {e}")
+        return None
+    return digest.hexdigest()
+
+def split_tag_twins(file_list):
+    """Splits files into those to fingerprint and {representative: [twins]}.
+
+    A twin has exactly the same artist, title and album as its representative, a duration within
+    DURATION_TOLERANCE seconds and a size within SIZE_TOLERANCE of it, so it can inherit the representative's
+    AcoustID. Files with a missing or placeholder tag are always fingerprinted, as their tags identify nothing.
+    """
+    representatives = defaultdict(list)
+    to_fingerprint = []
+    tag_twins = defaultdict(list)
+    for file_path in file_list:
+        cached = get_cached(file_path)
+        metadata = cached['metadata'] if cached else {}
+        duration = metadata.get('duration')
+        key = (metadata.get('artist', ''), metadata.get('title', ''), metadata.get('album', ''))
+        if duration is None or not PLACEHOLDER_TAGS.isdisjoint(key):
+            to_fingerprint.append(file_path)
+            continue
+
+        size = metadata['size']
+        for representative, representative_duration, representative_size in representatives.get(key, []):
+            if (abs(duration - representative_duration) <= DURATION_TOLERANCE
+                    and abs(size - representative_size) <= SIZE_TOLERANCE * max(size, representative_size)):
+                tag_twins[representative].append(file_path)
+                break
+        else:
+            representatives[key].append((file_path, duration, size))
+            to_fingerprint.append(file_path)
+    return to_fingerprint, tag_twins
+
+def run_acoustid_pipeline(file_list, acoustid_results, progress_bar, pool=None):
+    """Fingerprints files and looks up their AcoustIDs, grouping them into acoustid_results.
+
+    Fingerprinting is CPU-bound and runs in the process pool, while the
+    network-bound AcoustID lookups run concurrently in a rate-limited thread pool.
+    """
+    # Files with a cached AcoustID are resolved here, only the rest are sent to the pool for fingerprinting
+    uncached = []
+    for file_path in file_list:
+        cached = get_cached(file_path)
+        if cached and cached['acoustid']:
+            record_acoustid_result(file_path, cached['acoustid'], acoustid_results, progress_bar)
+        else:
+            uncached.append(file_path)
+    file_list = uncached
+
+    # Each lookup puts itself on this queue when it finishes, so its results are handled by this thread
+    completed = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=ACOUSTID_LOOKUP_THREADS if pool is not None else 1)
+    try:
+        if pool is not None:
+            # Use imap_unordered so lookups are queued as soon as fingerprints are ready
+            fingerprint_results = pool.imap_unordered(process_file_acoustid, file_list)
+        else:
+            # Single-threaded processing for debugging
+            fingerprint_results = map(process_file_acoustid, file_list)
+        outstanding = queue_acoustid_lookups(fingerprint_results, executor, completed, acoustid_results, progress_bar)
+
+        # Every file is fingerprinted, wait for the lookups still running
+        for _ in range(outstanding):
+            record_lookup_batch(completed.get(), acoustid_results, progress_bar)
+    except BaseException:
+        # Drop the queued lookups instead of waiting for them at the rate limit; finished ones are already cached
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+def queue_acoustid_lookups(fingerprint_results, executor, completed, acoustid_results, progress_bar=None):
+    """Submits fingerprinted files to the executor in batches of ACOUSTID_BATCH_SIZE and returns how many are still running.
+
+    Lookups that finish meanwhile are taken off the completed queue as fingerprints arrive, so their AcoustIDs
+    are cached and the progress bar advances while fingerprinting is still going on.
+    """
+    outstanding = 0
+    batch = []
+    for file_path, rid, fingerprint_data in fingerprint_results:
+        while True:
+            try:
+                future = completed.get_nowait()
+            except queue.Empty:
+                break
+            record_lookup_batch(future, acoustid_results, progress_bar)
+            outstanding -= 1
+
+        if not fingerprint_data:
+            # Cached AcoustID or failed fingerprint, nothing to look up
+            record_acoustid_result(file_path, rid, acoustid_results, progress_bar)
+            continue
+
+        batch.append((file_path, *fingerprint_data))
+        if len(batch) == ACOUSTID_BATCH_SIZE:
+            executor.submit(lookup_acoustid_batch, batch).add_done_callback(completed.put)
+            outstanding += 1
+            batch = []
+
+    if batch:
+        executor.submit(lookup_acoustid_batch, batch).add_done_callback(completed.put)
+        outstanding += 1
+    return outstanding
+
+def record_lookup_batch(future, acoustid_results, progress_bar=None):
+    """Caches and records the (file_path, rid) results of a finished lookup batch."""
+    for file_path, rid in future.result():
+        if rid:
+            # Cache the AcoustID result
+            cache_acoustid(file_path, rid)
+        record_acoustid_result(file_path, rid, acoustid_results, progress_bar)
+
+def record_acoustid_result(file_path, rid, acoustid_results, progress_bar=None):
+    """Groups a file under its AcoustID and updates the lookup statistics."""
     if rid:
-        return rid, file_path
-    return None
+        acoustid_results[rid].append(file_path)
+    summary_stats['total_acoustid_lookups'] += 1
+
+    # Update progress bar
+    if progress_bar:
+        progress_bar.update(1)
+
+def process_file_acoustid(file_path):
+    """Fingerprints a file for AcoustID lookup, unless its AcoustID is already cached."""
+    try:
+        st = os.stat(file_path)
+        cached = get_cached(file_path, st.st_size, st.st_mtime)
+    except OSError as e:
+        logging.error(f"File not found: {file_path} - {e}")
+        return file_path, None, None
+    if cached and cached['acoustid']:
+        return file_path, cached['acoustid'], None
+    duration = cached['metadata'].get('duration') if cached else None
+    prefetch_file(file_path, st.st_size, duration)
+    return file_path, None, fingerprint_file(file_path)
+
+def prefetch_file(file_path, size, duration):
+    """Asks the kernel to start reading the part of the file the fingerprinter decodes into the page cache."""
+    # The decoder opens the file itself, so only page-cache advice (not per-descriptor advice) carries over
+    if not hasattr(os, 'posix_fadvise') or not duration:
+        return
+
+    # fpcalc only decodes the first acoustid.MAX_AUDIO_LENGTH seconds; the margin covers tags and
+    # artwork ahead of the audio, so long tracks don't read ahead data that is never used
+    length = int(size * min(1.0, PREFETCH_MARGIN * acoustid.MAX_AUDIO_LENGTH / duration))
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 def resolve_duplicates(duplicates, action='list', move_dir=None, base_dir=None, verbose=False):
-    """Resolves duplicates by either listing, moving, or deleting them."""
+    """Resolves duplicates by either listing, moving, or deleting them.
+
+    Files are re-validated and the best file chosen sequentially, since that uses the cache connection;
+    the moves or deletes of all sets then run concurrently in a thread pool.
+    """
+    removals = []
+    if action == 'move' and move_dir:
+        # Target directories already created and whether a plain rename can work, shared by all sets
+        os.makedirs(move_dir, exist_ok=True)
+        created_dirs = {move_dir}
+        same_device = os.stat(base_dir).st_dev == os.stat(move_dir).st_dev
+
     for duplicate_set in duplicates:
         best_file = None
         best_metadata = None
         to_delete = []
+        file_sizes = {}
 
         # Re-validate before taking action
         for file_path in duplicate_set:
             metadata, _ = validate_cached_data(file_path)
             if not metadata:
                 continue
+            file_sizes[file_path] = metadata['size']
 
             if best_file is None or (metadata['format'] == 'flac' and (best_metadata is None or metadata['size'] > best_metadata['size'])):
                 if best_file:
@@ -392,19 +1003,42 @@ def resolve_duplicates(duplicates, action='list', move_dir=None, base_dir=None,
 
         # Update summary statistics
         summary_stats['total_files_to_remove'] += len(to_delete)
-        summary_stats['total_storage_to_save'] += sum(os.path.getsize(f) for f in to_delete if os.path.exists(f))
+        summary_stats['total_storage_to_save'] += sum(file_sizes[f] for f in to_delete)
 
         if action == 'list':
             logging.info(f"Best file: {best_file}")
             for file in to_delete:
                 logging.info(f"To delete: {file}")
-        elif action == 'move' and move_dir:
-            move_duplicates(to_delete, best_file, move_dir, base_dir)
-        elif action == 'delete':
-            delete_duplicates(to_delete)
+        elif to_delete:
+            removals.append((to_delete, best_file))
+
+    if not removals or not (action == 'delete' or (action == 'move' and move_dir)):
+        return
 
-def move_duplicates(to_delete, original_file, move_dir, base_dir):
+    with ThreadPoolExecutor(max_workers=RESOLVE_THREADS) as executor:
+        if action == 'move':
+            futures = {
+                executor.submit(move_duplicates, to_delete, best_file, move_dir, base_dir, created_dirs, same_device): to_delete
+                for to_delete, best_file in removals
+            }
+        else:
+            futures = {executor.submit(delete_duplicates, to_delete): to_delete for to_delete, _ in removals}
+
+        # File errors are logged per file; anything unexpected is logged for every affected set, not just the first
+        first_error = None
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Failed to {action} duplicates {futures[future]}: {e}")
+                first_error = first_error or e
+        if first_error:
+            raise first_error
+
+def move_duplicates(to_delete, original_file, move_dir, base_dir, created_dirs=None, same_device=True):
     """Moves duplicate files to a new directory while keeping the folder structure intact."""
+    if created_dirs is None:
+        created_dirs = set()
     for file_path in to_delete:
         # Create the relative path based on the base directory
         relative_path = os.path.relpath(file_path, start=base_dir)
@@ -413,14 +1047,31 @@ def move_duplicates(to_delete, original_file, move_dir, base_dir):
         target_path = os.path.join(move_dir, relative_path)
         target_dir_path = os.path.dirname(target_path)
 
-        # Ensure the target directory exists
-        if not os.path.exists(target_dir_path):
-            os.makedirs(target_dir_path)
+        try:
+            # Ensure the target directory exists, once per directory
+            if target_dir_path not in created_dirs:
+                os.makedirs(target_dir_path, exist_ok=True)
+                created_dirs.add(target_dir_path)
 
-        # Move the file to the target directory
-        shutil.move(file_path, target_path)
+            move_file(file_path, target_path, same_device)
+        except OSError as e:
+            logging.error(f"Error moving file {file_path} to {target_path}: {e}")
+            continue
         logging.info(f"Moved {file_path} to {target_path}")
 
+def move_file(file_path, target_path, same_device=True):
+    """Moves a file with a single rename, copying only when the target is on another filesystem."""
+    if not same_device:
+        shutil.move(file_path, target_path)
+        return
+    try:
+        os.replace(file_path, target_path)
+    except OSError as e:
+        # A file below a different mount point than the scanned directory
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(file_path, target_path)
+
 def delete_duplicates(to_delete):
     """Deletes duplicate files."""
     for file_path in to_delete:
@@ -438,7 +1089,7 @@ def display_summary():
     logging.info(f"Total files to remove: {summary_stats['total_files_to_remove']}")
     logging.info(f"Estimated storage saved: {summary_stats['total_storage_to_save'] / (1024 * 1024):.2f} MB")
     logging.info("\nFiles processed by format:")
-    for format, count in summary_stats['files_by_format'].items():
+    for format, count in summary_stats['files_by_format'].most_common():
         logging.info(f"  {format.upper()}: {count} files")
 
 def main():
@@ -465,22 +1116,33 @@ def main():
     if args.action == 'move' and not args.move_dir:
         parser.error("--move-dir is required when action is 'move'")
 
+    # The run allocates many long-lived dicts and tuples and few reference cycles
+    gc.set_threshold(*GC_THRESHOLD)
+
     start_time = time.time()
 
     logging.info("Starting music deduplication process...")
     logging.info(f"Scanning directory: {args.path}")
 
-    # Run the duplicate finding and processing logic
-    duplicates = find_duplicates(args.path, verbose=args.verbose, use_multiprocessing=not args.no_multiprocessing)
-
-    if duplicates:
-        logging.info(f"Found {len(duplicates)} sets of duplicates.")
-        resolve_duplicates(duplicates, args.action, args.move_dir, base_dir=os.path.abspath(args.path), verbose=args.verbose)
-    else:
-        logging.info("No duplicates found.")
-
-    # Save cache at the end
-    save_cache()
+    # One worker pool for the whole run instead of a new one per phase
+    pool = None if args.no_multiprocessing else create_worker_pool()
+    try:
+        # Run the duplicate finding and processing logic
+        try:
+            duplicates = find_duplicates(args.path, verbose=args.verbose, pool=pool)
+        finally:
+            # All results have been collected (or the run failed), like leaving a `with Pool()` block
+            if pool is not None:
+                pool.terminate()
+
+        if duplicates:
+            logging.info(f"Found {len(duplicates)} sets of duplicates.")
+            resolve_duplicates(duplicates, args.action, args.move_dir, base_dir=os.path.abspath(args.path), verbose=args.verbose)
+        else:
+            logging.info("No duplicates found.")
+    finally:
+        # Commit pending cache writes even if the run is interrupted or fails
+        save_cache()
 
     total_time = time.time() - start_time
     logging.info(f"\nCompleted in {total_time:.2f} seconds.")